@@ -3,6 +3,7 @@ from django.views import View
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 from django.db.models import Count, Q, Sum
 from django.db.models.functions import TruncDate
 from django.http import JsonResponse
@@ -316,7 +317,7 @@ def checkin_participant(request, pk):
             participant.is_checked_in = True
             participant.checked_in_at = timezone.now()
 
-        participant.save()
+        participant.save(update_fields=["is_checked_in", "checked_in_at"])
 
         return JsonResponse(
             {
@@ -337,15 +338,21 @@ def checkin_participant(request, pk):
 def update_score(request, pk):
     """Update participant score."""
     if request.method == "POST":
-        participant = get_object_or_404(Participant, pk=pk)
-
         try:
             import json
 
             data = json.loads(request.body)
             score = int(data.get("score", 0))
-            participant.score = score
-            participant.save()
+
+            # Score write and re-rank commit together, with the row locked
+            with transaction.atomic():
+                participant = get_object_or_404(
+                    Participant.objects.select_for_update().only("id", "score"), pk=pk
+                )
+                old_score = participant.score
+                participant.score = score
+                participant.save(update_fields=["score"])
+                Participant.update_ranks(min(old_score, score), max(old_score, score))
 
             return JsonResponse(
                 {
@@ -5,7 +5,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.contrib.auth.hashers import check_password
 from apps.public.models import Participant, PhoneVerification
-from apps.public.services import EskizSMS
+from apps.public.services import get_sms_service
 
 @method_decorator(csrf_exempt, name="dispatch")
 class SendVerificationAPIView(View):
@@ -34,13 +34,9 @@ class SendVerificationAPIView(View):
 
         # Send verification code
         try:
-            sms_service = EskizSMS()
-            result = sms_service.send_verification_code(formatted_phone)
-
-            if result["success"]:
-                return JsonResponse({"success": True, "message": "Код отправлен"})
-            else:
-                return JsonResponse({"success": False, "error": result.get("error", "sms_error"), "message": result.get("error", "Ошибка отправки SMS")}, status=500)
+            sms_service = get_sms_service()
+            sms_service.send_verification_code_in_background(formatted_phone)
+            return JsonResponse({"success": True, "message": "Код отправлен"})
         except Exception as e:
             return JsonResponse({"success": False, "error": str(e), "message": f"Ошибка: {str(e)}"}, status=500)
 
@@ -63,7 +59,7 @@ class VerifyPhoneAPIView(View):
         formatted_phone = f"+998{digits}"
 
         # Verify code
-        sms_service = EskizSMS()
+        sms_service = get_sms_service()
         result = sms_service.verify_code(formatted_phone, code)
 
         if result["success"]:
@@ -128,7 +124,7 @@ class RegisterAPIView(View):
                 test_language=data["test_language"],
             )
             participant.set_password(data["password"])
-            participant.save()
+            participant.save(force_insert=True)
 
             # Log in the user
             request.session["participant_id"] = str(participant.id)
@@ -43,6 +43,13 @@ class ParticipantAdmin(admin.ModelAdmin):
         }),
     )
     
+    def save_model(self, request, obj, form, change):
+        """Save only the edited fields so a stale rank is never written back."""
+        if change:
+            obj.save(update_fields=form.changed_data)
+        else:
+            super().save_model(request, obj, form, change)
+
     def changelist_view(self, request, extra_context=None):
         """Add language statistics to the changelist view."""
         extra_context = extra_context or {}
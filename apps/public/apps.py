@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PublicConfig(AppConfig):
     name = 'apps.public'
+
+    def ready(self):
+        from . import signals  # noqa: F401
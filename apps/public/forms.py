@@ -139,7 +139,7 @@ class ParticipantRegistrationForm(forms.ModelForm):
         participant.username = participant.phone_number
         participant.set_password(self.cleaned_data["password"])
         if commit:
-            participant.save()
+            participant.save(force_insert=True)
         return participant
 
 
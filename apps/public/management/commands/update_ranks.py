@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from apps.public.models import Participant
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored leaderboard rank of every participant. "
+        "Score edits and deletions keep ranks current; run this after bulk "
+        "imports or direct database changes, or nightly from cron."
+    )
+
+    def handle(self, *args, **options):
+        Participant.update_ranks()
+        self.stdout.write(self.style.SUCCESS("Participant ranks updated."))
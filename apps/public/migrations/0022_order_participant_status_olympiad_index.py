@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-16 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('public', '0021_remove_achievement_label_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['participant', 'status', 'olympiad'], name='public_orde_partici_537aed_idx'),
+        ),
+    ]
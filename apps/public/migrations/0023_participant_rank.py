@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-16 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('public', '0022_order_participant_status_olympiad_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='participant',
+            name='rank',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True, verbose_name='Место в рейтинге'),
+        ),
+    ]
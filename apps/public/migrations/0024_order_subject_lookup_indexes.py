@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-16 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('public', '0023_participant_rank'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['participant', 'status', 'subject'], name='public_orde_partici_487d3e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['participant', 'status', 'created_at'], name='public_orde_partici_01fb37_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subject',
+            index=models.Index(fields=['olympiad', 'ticket_price'], name='public_subj_olympia_23920e_idx'),
+        ),
+    ]
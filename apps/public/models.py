@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models import Count
+from django.core.cache import cache
 from django.contrib.auth.hashers import make_password, check_password
+import time
 import uuid
 
 class Subject(models.Model):
@@ -25,6 +28,9 @@ class Subject(models.Model):
         verbose_name = "Предмет"
         verbose_name_plural = "Предметы"
         ordering = ["name"]
+        indexes = [
+            models.Index(fields=["olympiad", "ticket_price"]),
+        ]
 
     def __str__(self):
         olympiad_name = self.olympiad.event_name if self.olympiad else 'Без олимпиады'
@@ -80,6 +86,10 @@ class Participant(models.Model):
 
     # Rating score set by admin
     score = models.IntegerField(default=0, verbose_name="Балл")
+    # Leaderboard position, recomputed by update_ranks() after score changes
+    rank = models.PositiveIntegerField(
+        null=True, blank=True, db_index=True, verbose_name="Место в рейтинге"
+    )
 
     # Telegram subscription
     telegram_user_id = models.BigIntegerField(
@@ -97,13 +107,61 @@ class Participant(models.Model):
     def __str__(self):
         return f"{self.fullname} - {self.school} ({self.grade} класс)"
 
+    LEADERBOARD_VERSION_KEY = "leaderboard:version"
+
+    @classmethod
+    def get_leaderboard_version(cls):
+        """Version of the cached leaderboard fragments; vary them on it."""
+        return cache.get_or_set(cls.LEADERBOARD_VERSION_KEY, time.time_ns, None)
+
+    @classmethod
+    def bump_leaderboard_version(cls):
+        """Make every cached leaderboard fragment stale."""
+        cache.set(cls.LEADERBOARD_VERSION_KEY, time.time_ns(), None)
+
+    def get_rank(self):
+        """Leaderboard position: 1 + number of participants with a higher score."""
+        if self.rank is not None:
+            return self.rank
+        return Participant.objects.filter(score__gt=self.score).count() + 1
+
+    @classmethod
+    def update_ranks(cls, min_score=None, max_score=None):
+        """
+        Recompute stored ranks in one UPDATE.
+
+        When a score moves between two values, only participants scoring
+        within that range can change rank, so pass it as min/max_score.
+        """
+        participants = cls.objects.all()
+        above = 0
+        if min_score is not None:
+            participants = participants.filter(score__gte=min_score)
+        if max_score is not None:
+            participants = participants.filter(score__lte=max_score)
+            above = cls.objects.filter(score__gt=max_score).count()
+
+        score_counts = participants.values_list("score").annotate(n=Count("id")).order_by("-score")
+        whens = []
+        for score, n in score_counts:
+            whens.append(models.When(score=score, then=models.Value(above + 1)))
+            above += n
+        if whens:
+            participants.update(rank=models.Case(*whens, output_field=models.PositiveIntegerField()))
+        cls.bump_leaderboard_version()
+
     def set_password(self, raw_password):
         """Hash and set the password."""
         self.password = make_password(raw_password)
 
     def check_password(self, raw_password):
-        """Check if the given password matches."""
-        return check_password(raw_password, self.password)
+        """Check if the given password matches, upgrading an outdated hash."""
+        def setter(raw_password):
+            self.set_password(raw_password)
+            if self.pk:
+                Participant.objects.filter(pk=self.pk).update(password=self.password)
+
+        return check_password(raw_password, self.password, setter)
 
 
 class PhoneVerification(models.Model):
@@ -180,10 +238,31 @@ class OlympiadSettings(models.Model):
     def __str__(self):
         return f"{self.event_name} - {self.event_date.strftime('%d.%m.%Y %H:%M')}"
 
+    ACTIVE_CACHE_KEY = "olympiad:active"
+    ACTIVE_LIST_CACHE_KEY = "olympiads:active"
+    # The save/delete signals only clear the cache they can reach. With the
+    # default per-process LocMemCache, other workers keep the old active
+    # olympiad (and render tickets for it) until this timeout; set REDIS_URL
+    # in production so every worker shares one cache.
+    ACTIVE_CACHE_TIMEOUT = 300
+
     @classmethod
     def get_active(cls):
-        """Get the active olympiad settings."""
-        return cls.objects.filter(is_active=True).first()
+        """Get the active olympiad settings (cached, reset on save/delete)."""
+        return cache.get_or_set(
+            cls.ACTIVE_CACHE_KEY,
+            lambda: cls.objects.filter(is_active=True).first(),
+            cls.ACTIVE_CACHE_TIMEOUT,
+        )
+
+    @classmethod
+    def get_active_list(cls):
+        """Get all active olympiads by event date (cached, reset on save/delete)."""
+        return cache.get_or_set(
+            cls.ACTIVE_LIST_CACHE_KEY,
+            lambda: list(cls.objects.filter(is_active=True).order_by("event_date")),
+            cls.ACTIVE_CACHE_TIMEOUT,
+        )
 
 
 class Order(models.Model):
@@ -261,6 +340,13 @@ class Order(models.Model):
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ["-created_at"]
+        # participant + status lead every per-user order lookup; the last
+        # column serves the olympiad filter, subject filter and latest-order sort
+        indexes = [
+            models.Index(fields=["participant", "status", "olympiad"]),
+            models.Index(fields=["participant", "status", "subject"]),
+            models.Index(fields=["participant", "status", "created_at"]),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.participant.fullname} - {self.status}"
@@ -288,9 +374,39 @@ class Achievement(models.Model):
         verbose_name_plural = "Достижения (Зал славы)"
         ordering = ["order", "-created_at"]
 
+    ACTIVE_CACHE_KEY = "achievements:active"
+    ACTIVE_CACHE_TIMEOUT = 300
+    DETAIL_CACHE_KEY = "achievement:{pk}"
+    DETAIL_CACHE_TIMEOUT = 300
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def get_active(cls):
+        """Get active achievements in display order (cached, reset on save/delete)."""
+        return cache.get_or_set(
+            cls.ACTIVE_CACHE_KEY,
+            lambda: list(cls.objects.filter(is_active=True).order_by("order", "-created_at")),
+            cls.ACTIVE_CACHE_TIMEOUT,
+        )
+
+    @classmethod
+    def get_active_detail(cls, pk):
+        """
+        Get an active achievement with its gallery images prefetched, or None.
+
+        Cached per achievement; reset when it or its gallery images change.
+        Misses are not cached, so unknown pks do not fill the cache.
+        """
+        key = cls.DETAIL_CACHE_KEY.format(pk=pk)
+        achievement = cache.get(key)
+        if achievement is None:
+            achievement = cls.objects.prefetch_related("gallery_images").filter(pk=pk, is_active=True).first()
+            if achievement is not None:
+                cache.set(key, achievement, cls.DETAIL_CACHE_TIMEOUT)
+        return achievement
+
     def get_technologies_list(self):
         """Return technologies as a list."""
         if self.technologies:
@@ -335,9 +451,21 @@ class GuideVideo(models.Model):
         verbose_name_plural = "Видео руководства"
         ordering = ["-created_at"]
 
+    ACTIVE_CACHE_KEY = "guide_video:active"
+    ACTIVE_CACHE_TIMEOUT = 300
+
     def __str__(self):
         return self.title
 
+    @classmethod
+    def get_active(cls):
+        """Get the latest active guide video (cached, reset on save/delete)."""
+        return cache.get_or_set(
+            cls.ACTIVE_CACHE_KEY,
+            lambda: cls.objects.filter(is_active=True).first(),
+            cls.ACTIVE_CACHE_TIMEOUT,
+        )
+
 
 class Partner(models.Model):
     """Model for Partners (Hamkorlarimiz)."""
@@ -354,9 +482,21 @@ class Partner(models.Model):
         verbose_name_plural = "Партнеры"
         ordering = ["order", "-created_at"]
 
+    ACTIVE_CACHE_KEY = "partners:active"
+    ACTIVE_CACHE_TIMEOUT = 600
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_active(cls):
+        """Get active partners in display order (cached, reset on save/delete)."""
+        return cache.get_or_set(
+            cls.ACTIVE_CACHE_KEY,
+            lambda: list(cls.objects.filter(is_active=True).order_by("order", "-created_at")),
+            cls.ACTIVE_CACHE_TIMEOUT,
+        )
+
 
 class ContactMessage(models.Model):
     """Model for Contact Messages (Bog'lanish)."""
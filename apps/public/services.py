@@ -5,16 +5,71 @@ Token is stored in a local JSON file and automatically refreshed
 when expired or missing. Falls back to login if refresh fails.
 """
 import json
+import logging
 import os
 import random
+import re
+import threading
 import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from django.conf import settings
+from django.db import close_old_connections
 
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only
+    fcntl = None
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+
+logger = logging.getLogger(__name__)
 
 # Token storage file path
 TOKEN_FILE = Path(settings.BASE_DIR) / ".eskiz_token.json"
+TOKEN_LOCK_FILE = TOKEN_FILE.with_suffix(".json.lock")
+
+# Serializes token file writes between threads of the same worker;
+# flock on TOKEN_LOCK_FILE does the same across gunicorn workers.
+_token_lock = threading.Lock()
+
+# Ensures only one thread per worker refreshes an expired token at a time.
+_refresh_lock = threading.Lock()
+
+# Background senders so request threads don't wait on the Eskiz API
+_sms_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="eskiz-sms")
+
+# Verification SMS text; {code} is the 6-digit code
+SMS_TEMPLATE = "BOND Olimpiadasida telefon raqamni tastiqlash kodi: {code}"
+
+# Matches Eskiz messages about an expired, invalid or missing token
+_TOKEN_ERROR_RE = re.compile(
+    r"expired|token.*(?:invalid|not found)|(?:invalid|not found).*token",
+    re.IGNORECASE,
+)
+
+
+class EskizAuth(requests.auth.AuthBase):
+    """Attach the service's current bearer token to outgoing requests."""
+
+    def __init__(self, service: "EskizSMS"):
+        self.service = service
+
+    def __call__(self, request):
+        request.headers["Authorization"] = f"Bearer {self.service.token}"
+        return request
 
 
 class EskizSMS:
@@ -24,32 +79,48 @@ class EskizSMS:
 
     def __init__(self):
         self.token = self._load_token()
+        self.session = requests.Session()
+        self.session.auth = EskizAuth(self)
+        self.session.hooks["response"].append(self._retry_on_token_error)
 
     # ─── Token Management ────────────────────────────────────────
 
-    def _load_token(self) -> str:
-        """Load token from file. If missing or invalid, obtain a new one."""
+    def _read_token_file(self) -> str:
+        """Return the token stored in the file, or an empty string."""
         if TOKEN_FILE.exists():
             try:
-                data = json.loads(TOKEN_FILE.read_text(encoding="utf-8"))
-                token = data.get("token", "")
-                if token:
-                    return token
+                data = _json_loads(TOKEN_FILE.read_bytes())
+                return data.get("token", "")
             except (json.JSONDecodeError, OSError):
                 pass
+        return ""
+
+    def _load_token(self) -> str:
+        """Load token from file. If missing or invalid, obtain a new one."""
+        token = self._read_token_file()
+        if token:
+            return token
 
         # No valid token in file — get a fresh one
         return self._login()
 
     def _save_token(self, token: str):
-        """Persist token to file."""
+        """Persist token to file atomically (temp file + os.replace)."""
+        tmp_file = TOKEN_FILE.with_suffix(".json.tmp")
         try:
-            TOKEN_FILE.write_text(
-                json.dumps({"token": token, "updated_at": time.time()}),
-                encoding="utf-8",
-            )
+            with _token_lock, open(TOKEN_LOCK_FILE, "a") as lock:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    tmp_file.write_bytes(
+                        _json_dumps({"token": token, "updated_at": time.time()})
+                    )
+                    os.replace(tmp_file, TOKEN_FILE)
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
         except OSError as e:
-            print(f"[ESKIZ] Warning: could not save token file: {e}")
+            logger.warning("Could not save Eskiz token file: %s", e)
 
     def _login(self) -> str:
         """Authenticate with email/password and obtain a new token."""
@@ -61,7 +132,7 @@ class EskizSMS:
                 "ESKIZ_EMAIL and ESKIZ_PASSWORD must be set in settings.py"
             )
 
-        print(f"[ESKIZ] Logging in with {email}...")
+        logger.info("Logging in to Eskiz with %s", email)
 
         try:
             resp = requests.post(
@@ -69,23 +140,23 @@ class EskizSMS:
                 data={"email": email, "password": password},
                 timeout=15,
             )
-            result = resp.json()
+            result = _json_loads(resp.content)
 
             if resp.status_code == 200 and result.get("data", {}).get("token"):
                 token = result["data"]["token"]
                 self._save_token(token)
-                print("[ESKIZ] Login successful — new token saved.")
+                logger.info("Eskiz login successful — new token saved.")
                 return token
             else:
                 raise RuntimeError(
                     f"Eskiz login failed: {result.get('message', resp.text)}"
                 )
-        except requests.RequestException as e:
+        except (requests.RequestException, ValueError) as e:
             raise RuntimeError(f"Eskiz login request failed: {e}")
 
     def _refresh_token(self) -> str:
         """Try to refresh the current token. Falls back to login on failure."""
-        print("[ESKIZ] Attempting token refresh...")
+        logger.info("Attempting Eskiz token refresh...")
 
         try:
             resp = requests.patch(
@@ -93,20 +164,33 @@ class EskizSMS:
                 headers={"Authorization": f"Bearer {self.token}"},
                 timeout=15,
             )
-            result = resp.json()
+            result = _json_loads(resp.content)
 
             if resp.status_code == 200 and result.get("data", {}).get("token"):
                 token = result["data"]["token"]
                 self._save_token(token)
-                print("[ESKIZ] Token refreshed successfully.")
+                logger.info("Eskiz token refreshed successfully.")
                 return token
-        except requests.RequestException:
+        except (requests.RequestException, ValueError):
             pass
 
         # Refresh failed — fall back to full login
-        print("[ESKIZ] Refresh failed, falling back to login...")
+        logger.warning("Eskiz token refresh failed, falling back to login...")
         return self._login()
 
+    def _refresh_expired_token(self, expired_token: str) -> str:
+        """
+        Refresh the token at most once for concurrent callers.
+
+        Whoever takes the lock first refreshes; the others find a newer
+        token in the file and reuse it instead of calling Eskiz again.
+        """
+        with _refresh_lock:
+            token = self._read_token_file()
+            if token and token != expired_token:
+                return token
+            return self._refresh_token()
+
     # ─── SMS Sending ─────────────────────────────────────────────
 
     def generate_code(self) -> str:
@@ -115,9 +199,8 @@ class EskizSMS:
 
     def _send_request(self, phone: str, message: str) -> requests.Response:
         """Send a single SMS request with the current token."""
-        return requests.post(
+        return self.session.post(
             f"{self.BASE_URL}/message/sms/send",
-            headers={"Authorization": f"Bearer {self.token}"},
             data={
                 "mobile_phone": phone,
                 "message": message,
@@ -130,22 +213,14 @@ class EskizSMS:
         """
         Send SMS with automatic token retry.
 
-        If the first attempt returns 401/403 or 'Expired',
-        refreshes the token and retries once.
+        Token errors are handled by the session response hook, which
+        refreshes the token and replays the request once.
         """
         phone = phone_number.replace("+", "")
 
-        # First attempt
         try:
             resp = self._send_request(phone, message)
-            result = resp.json()
-
-            # Check for token expiration
-            if self._is_token_error(resp, result):
-                # Refresh and retry
-                self.token = self._refresh_token()
-                resp = self._send_request(phone, message)
-                result = resp.json()
+            result = _json_loads(resp.content)
 
             if resp.status_code == 200 and result.get("status") in (
                 "success",
@@ -158,46 +233,88 @@ class EskizSMS:
                     "error": result.get("message", "Unknown error"),
                 }
 
-        except requests.RequestException as e:
+        except (requests.RequestException, ValueError) as e:
             return {"success": False, "error": str(e)}
 
+    def _retry_on_token_error(self, resp: requests.Response, **kwargs):
+        """
+        Session response hook: on a token error, refresh and replay once.
+
+        Successful responses pass through untouched, so their body is
+        only decoded once by the caller.
+        """
+        if resp.status_code == 200:
+            return resp
+
+        try:
+            result = _json_loads(resp.content)
+        except ValueError:
+            result = {}
+        if not self._is_token_error(resp, result):
+            return resp
+
+        # Refresh (or pick up a concurrent refresh) and retry
+        used_token = resp.request.headers.get("Authorization", "")
+        self.token = self._refresh_expired_token(used_token.removeprefix("Bearer "))
+
+        request = resp.request.copy()
+        self.session.auth(request)
+        resp.close()
+
+        # Sent through the adapter directly, so this hook does not run again
+        retry = resp.connection.send(request, **kwargs)
+        retry.history.append(resp)
+        retry.request = request
+        return retry
+
     def _is_token_error(self, resp: requests.Response, result: dict) -> bool:
         """Check if the response indicates an expired or invalid token."""
         if resp.status_code in (401, 403):
             return True
 
-        msg = str(result.get("message", "")).lower()
-        status = str(result.get("status", "")).lower()
-
-        if "expired" in msg or "expired" in status:
-            return True
-        if "token" in msg and ("invalid" in msg or "not found" in msg):
-            return True
-
-        return False
+        # Message and status go on separate lines so the token/invalid
+        # pairing is only matched within a single field.
+        text = f"{result.get('message', '')}\n{result.get('status', '')}"
+        return bool(_TOKEN_ERROR_RE.search(text))
 
     # ─── Verification Code Flow ──────────────────────────────────
 
-    def send_verification_code(self, phone_number: str) -> dict:
-        """Generate and send verification code to the phone number."""
+    def send_verification_code_in_background(self, phone_number: str):
+        """
+        Store a new verification code and send it from a background thread.
+
+        The code is saved before sending so verify_code() accepts it as soon
+        as the SMS arrives; if sending fails, the code is deleted again, so
+        delivery errors are only logged. Storing or queueing errors raise.
+        """
         from .models import PhoneVerification
 
         code = self.generate_code()
-        message = f"BOND Olimpiadasida telefon raqamni tastiqlash kodi: {code}"
 
-        # Delete old verification codes for this number
+        # Replace old verification codes for this number
         PhoneVerification.objects.filter(phone_number=phone_number).delete()
+        verification = PhoneVerification.objects.create(
+            phone_number=phone_number, code=code
+        )
 
-        # Send SMS
-        result = self.send_sms(phone_number, message)
+        _sms_executor.submit(self._deliver_code, verification.pk, phone_number, code)
 
-        if result["success"]:
-            PhoneVerification.objects.create(
-                phone_number=phone_number, code=code
-            )
-            return {"success": True, "code": code}
-        else:
-            return result
+    def _deliver_code(self, verification_pk: int, phone_number: str, code: str):
+        """Send a stored verification code; drop it if the SMS fails."""
+        from .models import PhoneVerification
+
+        try:
+            result = self.send_sms(phone_number, SMS_TEMPLATE.format(code=code))
+            if not result["success"]:
+                logger.warning(
+                    "Verification SMS to %s failed: %s", phone_number, result.get("error")
+                )
+                PhoneVerification.objects.filter(pk=verification_pk).delete()
+        except Exception:
+            logger.exception("Verification SMS to %s failed", phone_number)
+            PhoneVerification.objects.filter(pk=verification_pk).delete()
+        finally:
+            close_old_connections()
 
     def verify_code(self, phone_number: str, code: str) -> dict:
         """Verify the code for the given phone number."""
@@ -220,3 +337,14 @@ class EskizSMS:
 
         except PhoneVerification.DoesNotExist:
             return {"success": False, "error": "invalid_code"}
+
+
+@lru_cache(maxsize=1)
+def get_sms_service() -> EskizSMS:
+    """
+    Return the process-wide EskizSMS instance.
+
+    Created lazily so importing this module never logs in to Eskiz; the
+    shared instance keeps its token and pooled HTTP connections.
+    """
+    return EskizSMS()
@@ -0,0 +1,85 @@
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Achievement, AchievementImage, GuideVideo, OlympiadSettings, Order, Participant, Partner
+
+
+@receiver([post_save, post_delete], sender=OlympiadSettings)
+def reset_active_olympiad_cache(sender, **kwargs):
+    """Drop the cached active olympiads whenever any olympiad changes."""
+    cache.delete_many([
+        OlympiadSettings.ACTIVE_CACHE_KEY,
+        OlympiadSettings.ACTIVE_LIST_CACHE_KEY,
+    ])
+
+
+@receiver([post_save, post_delete], sender=Achievement)
+@receiver([post_save, post_delete], sender=GuideVideo)
+@receiver([post_save, post_delete], sender=Partner)
+def reset_active_list_cache(sender, **kwargs):
+    """Drop the cached active objects of the changed model."""
+    cache.delete(sender.ACTIVE_CACHE_KEY)
+
+
+@receiver([post_save, post_delete], sender=Achievement)
+def reset_achievements_fragment_cache(sender, **kwargs):
+    """Drop the rendered achievements block of the profile page."""
+    cache.delete(make_template_fragment_key("profile_achievements"))
+
+
+@receiver([post_save, post_delete], sender=Partner)
+def reset_partners_fragment_cache(sender, **kwargs):
+    """Drop the rendered partners block of the profile page."""
+    cache.delete(make_template_fragment_key("profile_partners"))
+
+
+@receiver([post_save, post_delete], sender=Achievement)
+def reset_achievement_detail_cache(sender, instance, **kwargs):
+    """Drop the cached detail page data of the changed achievement."""
+    cache.delete(Achievement.DETAIL_CACHE_KEY.format(pk=instance.pk))
+
+
+@receiver([post_save, post_delete], sender=AchievementImage)
+def reset_achievement_gallery_cache(sender, instance, **kwargs):
+    """Drop the cached detail page data of the image's achievement."""
+    cache.delete(Achievement.DETAIL_CACHE_KEY.format(pk=instance.achievement_id))
+
+
+@receiver([post_save, post_delete], sender=Participant)
+def reset_leaderboard_fragment_cache(sender, **kwargs):
+    """Make the rendered leaderboards stale when a participant changes."""
+    Participant.bump_leaderboard_version()
+
+
+@receiver(post_delete, sender=Participant)
+def update_ranks_after_delete(sender, instance, **kwargs):
+    """Move up everyone who scored below the removed participant."""
+    Participant.update_ranks(max_score=instance.score)
+
+
+@receiver(post_delete, sender=Participant)
+def remove_cached_tickets(sender, instance, **kwargs):
+    """Delete the rendered ticket PDFs of a removed participant."""
+    shutil.rmtree(Path(settings.TICKET_CACHE_DIR) / str(instance.pk), ignore_errors=True)
+
+
+@receiver(post_save, sender=Order)
+def prerender_paid_ticket(sender, instance, update_fields=None, **kwargs):
+    """Render the ticket in the background once an order becomes paid."""
+    if instance.status != 'paid' or not instance.participant_id:
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+
+    # utils pulls in WeasyPrint, so import it only when a ticket is needed
+    from .utils import prerender_ticket_pdf
+
+    participant_id = instance.participant_id
+    transaction.on_commit(lambda: prerender_ticket_pdf(participant_id))
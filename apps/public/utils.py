@@ -1,12 +1,43 @@
 import io
 import os
 import base64
+import functools
+import hashlib
+import logging
+import tempfile
 import qrcode
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.db import close_old_connections
+from django.template.loader import get_template, render_to_string
 from weasyprint import HTML, CSS
 
 
+# Static assets embedded in the ticket PDF
+IMG_DIR = settings.BASE_DIR / "apps" / "public" / "static" / "public" / "img"
+FONTS_DIR = settings.BASE_DIR / "apps" / "public" / "static" / "public" / "fonts"
+LOGO1_PATH = str(IMG_DIR / "logo-1.png")
+LOGO2_PATH = str(IMG_DIR / "data.png")
+FONT_PATH = str(FONTS_DIR / "DejaVuSans.ttf")
+FONT_BOLD_PATH = str(FONTS_DIR / "DejaVuSans-Bold.ttf")
+
+TICKET_TEMPLATE = "public/ticket_template.html"
+TICKET_EVENT_NAME = "Bond - Viloyat bosqichi"
+# Part of every cached ticket's key: bump it when generate_ticket_pdf()
+# changes what it renders so already cached tickets are rebuilt
+TICKET_VERSION = "1"
+
+# Rendered ticket PDFs, one directory per participant, each file named by
+# a hash of everything the ticket shows
+TICKET_CACHE_DIR = Path(settings.TICKET_CACHE_DIR)
+
+# Single background renderer for pre-building tickets after payment
+_ticket_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ticket-pdf")
+
+logger = logging.getLogger(__name__)
+
+
 def generate_qr_code(data: str) -> bytes:
     """Generate QR code image as PNG bytes."""
     qr = qrcode.QRCode(
@@ -36,56 +67,157 @@ def image_to_base64(path: str) -> str:
         return ""
 
 
-def generate_ticket_pdf(participant, olympiad=None) -> bytes:
-    """Generate PDF ticket with QR code for participant using WeasyPrint."""
-    from .models import OlympiadSettings, Order, Subject
+def get_purchased_subjects(participant, olympiad):
+    """Return the subjects the participant has paid for in this olympiad."""
+    from .models import Order, Subject
+
+    if not olympiad:
+        return []
+    paid_subject_ids = Order.objects.filter(
+        participant=participant,
+        olympiad=olympiad,
+        status='paid',
+        subject__isnull=False
+    ).values("subject_id")
+    return Subject.objects.filter(pk__in=paid_subject_ids).only("id", "name")
+
+
+@functools.cache
+def _ticket_assets_hash() -> str:
+    """Hash the ticket template, logos and fonts (once per process)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in (get_template(TICKET_TEMPLATE).origin.name, LOGO1_PATH, LOGO2_PATH, FONT_PATH, FONT_BOLD_PATH):
+        try:
+            digest.update(Path(path).read_bytes())
+        except OSError:
+            digest.update(b"missing:" + str(path).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def ticket_cache_key(participant, olympiad, purchased_subjects) -> str:
+    """Hash the ticket version, assets and every piece of data it shows."""
+    parts = [
+        TICKET_VERSION,
+        _ticket_assets_hash(),
+        TICKET_EVENT_NAME,
+        str(participant.id),
+        participant.fullname,
+        participant.phone_number,
+        participant.school,
+        participant.district,
+        str(participant.grade),
+    ]
+    if olympiad:
+        parts += [str(olympiad.id), olympiad.updated_at.isoformat()]
+    parts += sorted(f"{s.id}:{s.name}" for s in purchased_subjects)
+    return hashlib.blake2b(
+        "\x1f".join(parts).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def get_cached_ticket_pdf(participant, olympiad=None):
+    """
+    Return the participant's ticket PDF opened for binary reading,
+    rendering it on a miss. The caller closes it (FileResponse does).
+
+    The file name changes whenever the ticket content would, so a stale
+    PDF is never served; the file is written to a temp file and moved
+    into place so concurrent requests never read a partial PDF. Older
+    PDFs of the same participant are removed once the new one is written;
+    the file is opened first, so a concurrent prune cannot break a
+    download that already holds it.
+    """
+    from .models import OlympiadSettings
+
+    if olympiad is None:
+        olympiad = OlympiadSettings.get_active()
+
+    purchased_subjects = list(get_purchased_subjects(participant, olympiad))
+    key = ticket_cache_key(participant, olympiad, purchased_subjects)
+    participant_dir = TICKET_CACHE_DIR / str(participant.id)
+    pdf_path = participant_dir / f"{key}.pdf"
+    try:
+        return open(pdf_path, "rb")
+    except FileNotFoundError:
+        pass
+
+    participant_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=participant_dir, suffix=".tmp", delete=False) as tmp:
+        try:
+            generate_ticket_pdf(participant, olympiad, target=tmp, purchased_subjects=purchased_subjects)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    pdf_file = open(tmp.name, "rb")
+    os.replace(tmp.name, pdf_path)
+
+    # Drop tickets superseded by this one
+    for old_path in participant_dir.glob("*.pdf"):
+        if old_path != pdf_path:
+            old_path.unlink(missing_ok=True)
+    return pdf_file
+
+
+def _prerender_ticket_pdf(participant_id):
+    """Render the participant's ticket for the active olympiad into the cache."""
+    from .models import Participant
+
+    try:
+        participant = Participant.objects.filter(pk=participant_id).first()
+        if participant:
+            get_cached_ticket_pdf(participant).close()
+    except Exception:
+        logger.exception("Could not pre-render ticket PDF for %s", participant_id)
+    finally:
+        close_old_connections()
+
+
+def prerender_ticket_pdf(participant_id):
+    """Queue a background render so the first ticket download is a cache hit."""
+    _ticket_executor.submit(_prerender_ticket_pdf, participant_id)
+
+
+def generate_ticket_pdf(participant, olympiad=None, target=None, purchased_subjects=None):
+    """
+    Generate PDF ticket with QR code for participant using WeasyPrint.
+
+    If ``target`` (a file-like object) is given, the PDF is written into it
+    and None is returned; otherwise the PDF bytes are returned.
+    """
+    from .models import OlympiadSettings
 
     # Generate QR code
     qr_bytes = generate_qr_code(str(participant.id))
     qr_code_base64 = base64.b64encode(qr_bytes).decode("utf-8")
 
-    # Get logo paths
-    img_dir = settings.BASE_DIR / "apps" / "public" / "static" / "public" / "img"
-    logo1_base64 = image_to_base64(str(img_dir / "logo-1.png"))
-    logo2_base64 = image_to_base64(str(img_dir / "data.png"))
-
-    # Get font paths
-    fonts_dir = settings.BASE_DIR / "apps" / "public" / "static" / "public" / "fonts"
-    font_path = str(fonts_dir / "DejaVuSans.ttf")
-    font_bold_path = str(fonts_dir / "DejaVuSans-Bold.ttf")
+    # Get logos
+    logo1_base64 = image_to_base64(LOGO1_PATH)
+    logo2_base64 = image_to_base64(LOGO2_PATH)
 
     # Get olympiad settings
     if olympiad is None:
         olympiad = OlympiadSettings.get_active()
 
     # Get purchased subjects
-    purchased_subjects = []
-    if olympiad:
-        purchased_subjects = Subject.objects.filter(
-            orders__participant=participant,
-            orders__olympiad=olympiad,
-            orders__status='paid'
-        ).distinct()
-
+    if purchased_subjects is None:
+        purchased_subjects = get_purchased_subjects(participant, olympiad)
 
     # Prepare context for template
     context = {
         "participant": participant,
-        "event_name": "Bond - Viloyat bosqichi",
+        "event_name": TICKET_EVENT_NAME,
         "qr_code_base64": qr_code_base64,
         "logo1_base64": logo1_base64,
         "logo2_base64": logo2_base64,
-        "font_path": font_path,
-        "font_bold_path": font_bold_path,
+        "font_path": FONT_PATH,
+        "font_bold_path": FONT_BOLD_PATH,
         "olympiad": olympiad,
         "purchased_subjects": purchased_subjects,
     }
 
     # Render HTML template
-    html_string = render_to_string("public/ticket_template.html", context)
+    html_string = render_to_string(TICKET_TEMPLATE, context)
 
     # Generate PDF with WeasyPrint
     html = HTML(string=html_string, base_url=str(settings.BASE_DIR))
-    pdf_bytes = html.write_pdf()
-
-    return pdf_bytes
+    return html.write_pdf(target=target)
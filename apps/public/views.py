@@ -1,36 +1,70 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.views import View
+from django.views.decorators.cache import cache_control
 import json
 import os
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 from .models import Participant, PhoneVerification, OlympiadSettings, Order, Subject, Achievement, AchievementImage, GuideVideo, Partner, ContactMessage
 from .forms import ParticipantRegistrationForm, LoginForm
-from .utils import generate_ticket_pdf
+from .services import get_sms_service
+from .utils import get_cached_ticket_pdf, get_purchased_subjects
 
 
-def load_regions():
-    """Load regions from JSON file."""
-    json_path = os.path.join(settings.BASE_DIR, "regions.json")
+# Subject (and olympiad) columns shown on subject purchase cards
+SUBJECT_CARD_FIELDS = (
+    "id", "name", "ticket_price", "olympiad__event_name", "olympiad__event_date",
+)
+
+
+def _read_json(filename):
+    """Read a JSON data file from the project root."""
+    json_path = os.path.join(settings.BASE_DIR, filename)
     with open(json_path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
+# Region/district lists never change at runtime, so read them once
+_REGIONS = _read_json("regions.json")
+_DISTRICTS = _read_json("districts.json")
+_DISTRICTS_BY_REGION = {}
+for _district in _DISTRICTS:
+    _DISTRICTS_BY_REGION.setdefault(_district["region_id"], []).append(_district)
+
+
+def load_regions():
+    """Return regions loaded from JSON file."""
+    return _REGIONS
+
+
 def load_districts():
-    """Load districts from JSON file."""
-    json_path = os.path.join(settings.BASE_DIR, "districts.json")
-    with open(json_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """Return districts loaded from JSON file."""
+    return _DISTRICTS
+
 
+# Pre-serialized district API responses, keyed by region ID
+_DISTRICTS_JSON_BY_REGION = {
+    region_id: json.dumps({"districts": districts})
+    for region_id, districts in _DISTRICTS_BY_REGION.items()
+}
+_NO_DISTRICTS_JSON = json.dumps({"districts": []})
 
+
+@cache_control(public=True, max_age=60 * 60 * 24)
 def get_districts_by_region(request, region_id):
     """API endpoint to get districts by region ID."""
-    districts = load_districts()
-    filtered = [d for d in districts if d["region_id"] == region_id]
-    return JsonResponse({"districts": filtered})
+    payload = _DISTRICTS_JSON_BY_REGION.get(region_id, _NO_DISTRICTS_JSON)
+    return HttpResponse(payload, content_type="application/json")
 
 
 class RegisterView(View):
@@ -118,29 +152,34 @@ class ProfileView(View):
             ).values_list('olympiad_id', flat=True))
             
             # Check which paid olympiads still have un-purchased subjects
-            for oid in paid_olympiad_ids:
-                total_subjects = Subject.objects.filter(olympiad_id=oid, ticket_price__gt=0).count()
-                purchased_subjects = Order.objects.filter(
-                    participant=participant, olympiad_id=oid, status='paid',
-                    subject__isnull=False
-                ).values_list('subject_id', flat=True).distinct().count()
-                if purchased_subjects < total_subjects:
-                    has_unpaid_subjects.add(oid)
+            total_subjects = dict(Subject.objects.filter(
+                olympiad_id__in=paid_olympiad_ids, ticket_price__gt=0
+            ).values('olympiad_id').annotate(c=Count('id')).values_list('olympiad_id', 'c'))
+            purchased_subjects = dict(Order.objects.filter(
+                participant=participant, olympiad_id__in=paid_olympiad_ids, status='paid',
+                subject__isnull=False
+            ).values('olympiad_id').annotate(
+                c=Count('subject_id', distinct=True)
+            ).values_list('olympiad_id', 'c'))
+            has_unpaid_subjects = {
+                oid for oid in paid_olympiad_ids
+                if purchased_subjects.get(oid, 0) < total_subjects.get(oid, 0)
+            }
 
-        olympiads = OlympiadSettings.objects.filter(is_active=True).order_by('event_date')
+        olympiads = OlympiadSettings.get_active_list()
 
         # Leaderboard data
         leaderboard = Participant.objects.all().order_by("-score")[:5]
         newest_participants = Participant.objects.all().order_by("-created_at")[:5]
         user_rank = 0
         if participant:
-            user_rank = Participant.objects.filter(score__gt=participant.score).count() + 1
+            user_rank = participant.get_rank()
         
         # Total students count for stats
         total_students = Participant.objects.count()
 
         # Partners
-        partners = Partner.objects.filter(is_active=True).order_by("order", "-created_at")
+        partners = Partner.get_active()
 
         # Available subjects for purchase (exclude already paid)
         available_subjects = []
@@ -153,18 +192,18 @@ class ProfileView(View):
             available_subjects = Subject.objects.filter(
                 olympiad__is_active=True,
                 ticket_price__gt=0
-            ).exclude(id__in=purchased_subject_ids).select_related('olympiad')
+            ).exclude(id__in=purchased_subject_ids).select_related('olympiad').only(*SUBJECT_CARD_FIELDS)
         else:
             available_subjects = Subject.objects.filter(
                 olympiad__is_active=True,
                 ticket_price__gt=0
-            ).select_related('olympiad')
+            ).select_related('olympiad').only(*SUBJECT_CARD_FIELDS)
 
         # Hall of Fame achievements
-        achievements = Achievement.objects.filter(is_active=True).order_by("order", "-created_at")
+        achievements = Achievement.get_active()
 
         # Guide video
-        guide_video = GuideVideo.objects.filter(is_active=True).first()
+        guide_video = GuideVideo.get_active()
 
         return render(request, "public/profile.html", {
             "participant": participant,
@@ -174,6 +213,7 @@ class ProfileView(View):
             "leaderboard": leaderboard,
             "newest_participants": newest_participants,
             "user_rank": user_rank,
+            "leaderboard_version": Participant.get_leaderboard_version(),
             "total_students": total_students,
             "achievements": achievements,
             "guide_video": guide_video,
@@ -235,23 +275,31 @@ class TicketView(View):
         if not participant_id:
             return redirect("public:login")
 
-        participant = get_object_or_404(Participant, id=participant_id)
+        participant = get_object_or_404(
+            Participant.objects.only("id", "fullname", "phone_number", "school", "district", "grade"),
+            id=participant_id,
+        )
         
         olympiad_id = request.GET.get("olympiad_id")
         olympiad = None
 
         if olympiad_id:
-            # Check for specific olympiad payment
-            olympiad = get_object_or_404(OlympiadSettings, id=olympiad_id)
-            has_paid = Order.objects.filter(
-                participant=participant,
-                olympiad=olympiad,
-                status='paid'
-            ).exists()
-            
-            # Check if any subject has a price > 0 for this olympiad
-            has_priced_subject = Subject.objects.filter(olympiad=olympiad, ticket_price__gt=0).exists()
-            if has_priced_subject and not has_paid:
+            # Fetch the olympiad together with its payment checks: whether the
+            # participant paid for it and whether any subject has a price > 0
+            olympiad = get_object_or_404(
+                OlympiadSettings.objects.annotate(
+                    has_paid=Exists(Order.objects.filter(
+                        participant=participant,
+                        olympiad=OuterRef('pk'),
+                        status='paid'
+                    )),
+                    has_priced_subject=Exists(Subject.objects.filter(
+                        olympiad=OuterRef('pk'), ticket_price__gt=0
+                    )),
+                ),
+                id=olympiad_id,
+            )
+            if olympiad.has_priced_subject and not olympiad.has_paid:
                 # Redirect to payment for this specific olympiad
                 return redirect(f"{reverse('public:payment')}?olympiad_id={olympiad.id}")
         else:
@@ -271,13 +319,7 @@ class TicketView(View):
                     return redirect("public:payment")
 
         # Get all purchased subjects for this olympiad
-        purchased_subjects = []
-        if olympiad:
-            purchased_subjects = Subject.objects.filter(
-                orders__participant=participant,
-                orders__olympiad=olympiad,
-                orders__status='paid'
-            ).distinct()
+        purchased_subjects = get_purchased_subjects(participant, olympiad)
 
         return render(request, "public/ticket_view.html", {
             "participant": participant,
@@ -294,18 +336,23 @@ class RatingView(View):
         if not participant_id:
             return redirect("public:login")
 
-        participant = get_object_or_404(Participant, id=participant_id)
+        participant = get_object_or_404(
+            Participant.objects.only("id", "fullname", "score", "rank"), id=participant_id
+        )
 
         # leaderboard logic (top 50 by score)
-        leaderboard = Participant.objects.filter(score__gt=0).order_by("-score")[:50]
+        leaderboard = Participant.objects.filter(score__gt=0).only(
+            "id", "fullname", "school", "grade", "score"
+        ).order_by("-score")[:50]
         
         # find user rank
-        user_rank = Participant.objects.filter(score__gt=participant.score).count() + 1
+        user_rank = participant.get_rank()
         
         return render(request, "public/rating.html", {
             "participant": participant,
             "leaderboard": leaderboard,
-            "user_rank": user_rank
+            "user_rank": user_rank,
+            "leaderboard_version": Participant.get_leaderboard_version(),
         })
 
 
@@ -322,8 +369,8 @@ class DownloadTicketView(View):
         
         olympiad = OlympiadSettings.get_active() # Or pass via GET
         
-        buffer = generate_ticket_pdf(participant, olympiad)
-        return FileResponse(buffer, as_attachment=True, filename=f"ticket_{participant.fullname}.pdf")
+        pdf_file = get_cached_ticket_pdf(participant, olympiad)
+        return FileResponse(pdf_file, as_attachment=True, filename=f"ticket_{participant.fullname}.pdf")
 
 
 class ViewTicketPDFView(View):
@@ -333,8 +380,8 @@ class ViewTicketPDFView(View):
         participant = get_object_or_404(Participant, id=uuid)
         olympiad = OlympiadSettings.get_active() 
         
-        buffer = generate_ticket_pdf(participant, olympiad)
-        return FileResponse(buffer, content_type='application/pdf')
+        pdf_file = get_cached_ticket_pdf(participant, olympiad)
+        return FileResponse(pdf_file, content_type='application/pdf', filename=f"ticket_{participant.fullname}.pdf")
 
 
 class PaymentView(View):
@@ -345,7 +392,7 @@ class PaymentView(View):
         if not participant_id:
             return redirect("public:login")
 
-        participant = get_object_or_404(Participant, id=participant_id)
+        participant = get_object_or_404(Participant.objects.only("id"), id=participant_id)
         
         target_olympiad_id = request.GET.get("olympiad_id")
         
@@ -353,7 +400,7 @@ class PaymentView(View):
         subject_qs = Subject.objects.filter(
             olympiad__is_active=True, 
             ticket_price__gt=0
-        ).select_related('olympiad')
+        ).select_related('olympiad').only(*SUBJECT_CARD_FIELDS)
         
         if target_olympiad_id:
             subject_qs = subject_qs.filter(olympiad_id=target_olympiad_id)
@@ -369,15 +416,19 @@ class PaymentView(View):
         
         # If specific olympiad requested, redirect only if ALL subjects are paid
         if target_olympiad_id:
-            total_subjects = Subject.objects.filter(
-                olympiad_id=target_olympiad_id, ticket_price__gt=0
-            ).count()
+            priced_subjects = Subject.objects.filter(
+                olympiad=OuterRef('pk'), ticket_price__gt=0
+            ).values('olympiad').annotate(c=Count('pk')).values('c')
             paid_orders = Order.objects.filter(
                 participant=participant,
-                olympiad_id=target_olympiad_id,
+                olympiad=OuterRef('pk'),
                 status='paid'
-            ).count()
-            if total_subjects > 0 and paid_orders >= total_subjects:
+            ).values('olympiad').annotate(c=Count('pk')).values('c')
+            counts = OlympiadSettings.objects.filter(id=target_olympiad_id).annotate(
+                total_subjects=Coalesce(Subquery(priced_subjects), 0),
+                paid_orders=Coalesce(Subquery(paid_orders), 0),
+            ).values('total_subjects', 'paid_orders').first()
+            if counts and 0 < counts['total_subjects'] <= counts['paid_orders']:
                 return redirect(f"{reverse('public:view_ticket')}?olympiad_id={target_olympiad_id}")
 
         # Get pending order if exists
@@ -415,6 +466,18 @@ class SubscribeView(View):
         })
 
 
+# Keep-alive connection pool for Telegram Bot API calls
+_telegram_session = requests.Session()
+_telegram_session.mount("https://", HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    max_retries=Retry(total=2, backoff_factor=0.1),
+))
+
+TELEGRAM_SUBSCRIBED_CACHE_KEY = "tg:sub:{user_id}"
+TELEGRAM_SUBSCRIBED_CACHE_TIMEOUT = 300
+
+
 def check_subscription(request):
     """API endpoint to check Telegram channel subscription."""
     participant_id = request.session.get("participant_id")
@@ -435,9 +498,14 @@ def check_subscription(request):
     channel_id = settings.TELEGRAM_CHANNEL_ID
     user_id = participant.telegram_user_id
 
+    # Recently confirmed subscriptions skip the API call
+    cache_key = TELEGRAM_SUBSCRIBED_CACHE_KEY.format(user_id=user_id)
+    if cache.get(cache_key):
+        return JsonResponse({"subscribed": True})
+
     try:
         url = f"https://api.telegram.org/bot{bot_token}/getChatMember"
-        response = requests.get(url, params={
+        response = _telegram_session.get(url, params={
             "chat_id": channel_id,
             "user_id": user_id
         }, timeout=10)
@@ -449,8 +517,8 @@ def check_subscription(request):
             # member, administrator, creator are valid subscription statuses
             if status in ["member", "administrator", "creator"]:
                 # Update participant's subscription status
-                participant.telegram_subscribed = True
-                participant.save()
+                Participant.objects.filter(pk=participant.pk).update(telegram_subscribed=True)
+                cache.set(cache_key, True, TELEGRAM_SUBSCRIBED_CACHE_TIMEOUT)
                 return JsonResponse({"subscribed": True})
         
         return JsonResponse({"subscribed": False})
@@ -459,6 +527,17 @@ def check_subscription(request):
         return JsonResponse({"error": "telegram_api_error"}, status=500)
 
 
+_NON_DIGIT_RE = re.compile(r"\D")
+
+
+def _phone_digits(phone_number):
+    """Return the local part of an Uzbek phone number (digits after 998)."""
+    digits = _NON_DIGIT_RE.sub("", phone_number)
+    if digits.startswith("998"):
+        digits = digits[3:]
+    return digits
+
+
 def send_verification_code(request):
     """API endpoint to send SMS verification code."""
     if request.method != "POST":
@@ -471,10 +550,7 @@ def send_verification_code(request):
         return JsonResponse({"error": "invalid_json"}, status=400)
 
     # Validate and format phone number
-    digits = "".join(filter(str.isdigit, phone_number))
-    print(digits)
-    if digits.startswith("998"):
-        digits = digits[3:]
+    digits = _phone_digits(phone_number)
     
     if len(digits) != 9:
         return JsonResponse({"error": "invalid_phone", "message": "Введите 9 цифр номера"}, status=400)
@@ -487,14 +563,9 @@ def send_verification_code(request):
 
     # Send verification code
     try:
-        from .services import EskizSMS
-        sms_service = EskizSMS()
-        result = sms_service.send_verification_code(formatted_phone)
-
-        if result["success"]:
-            return JsonResponse({"success": True, "message": "Код отправлен"})
-        else:
-            return JsonResponse({"success": False, "error": result.get("error", "sms_error"), "message": result.get("error", "Ошибка отправки SMS")}, status=500)
+        sms_service = get_sms_service()
+        sms_service.send_verification_code_in_background(formatted_phone)
+        return JsonResponse({"success": True, "message": "Код отправлен"})
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -514,14 +585,11 @@ def verify_phone_code(request):
         return JsonResponse({"error": "invalid_json"}, status=400)
 
     # Format phone number
-    digits = "".join(filter(str.isdigit, phone_number))
-    if digits.startswith("998"):
-        digits = digits[3:]
+    digits = _phone_digits(phone_number)
     formatted_phone = f"+998{digits}"
 
     # Verify code
-    from .services import EskizSMS
-    sms_service = EskizSMS()
+    sms_service = get_sms_service()
     result = sms_service.verify_code(formatted_phone, code)
 
     if result["success"]:
@@ -545,11 +613,6 @@ def change_password(request):
     if not participant_id:
         return JsonResponse({"error": "not_authenticated"}, status=401)
 
-    try:
-        participant = Participant.objects.get(id=participant_id)
-    except Participant.DoesNotExist:
-        return JsonResponse({"error": "participant_not_found"}, status=404)
-
     try:
         data = json.loads(request.body)
         current_password = data.get("current_password", "")
@@ -560,14 +623,21 @@ def change_password(request):
     if not current_password or not new_password:
         return JsonResponse({"success": False, "message": "Заполните все поля"}, status=400)
 
-    if not participant.check_password(current_password):
-        return JsonResponse({"success": False, "message": "Неверный текущий пароль"}, status=400)
+    # Lock the row so concurrent changes cannot overwrite each other
+    with transaction.atomic():
+        try:
+            participant = Participant.objects.select_for_update().only("id", "password").get(id=participant_id)
+        except Participant.DoesNotExist:
+            return JsonResponse({"error": "participant_not_found"}, status=404)
 
-    if len(new_password) < 4:
-        return JsonResponse({"success": False, "message": "Пароль должен быть минимум 4 символа"}, status=400)
+        if not participant.check_password(current_password):
+            return JsonResponse({"success": False, "message": "Неверный текущий пароль"}, status=400)
 
-    participant.set_password(new_password)
-    participant.save()
+        if len(new_password) < 4:
+            return JsonResponse({"success": False, "message": "Пароль должен быть минимум 4 символа"}, status=400)
+
+        participant.set_password(new_password)
+        Participant.objects.filter(pk=participant.pk).update(password=participant.password)
 
     return JsonResponse({"success": True, "message": "Пароль успешно изменён"})
 
@@ -594,9 +664,7 @@ def send_password_reset_code(request):
         return JsonResponse({"error": "invalid_json"}, status=400)
 
     # Validate and format phone number
-    digits = "".join(filter(str.isdigit, phone_number))
-    if digits.startswith("998"):
-        digits = digits[3:]
+    digits = _phone_digits(phone_number)
     
     if len(digits) != 9:
         return JsonResponse({"error": "invalid_phone", "message": "Введите 9 цифр номера"}, status=400)
@@ -609,14 +677,9 @@ def send_password_reset_code(request):
 
     # Send verification code
     try:
-        from .services import EskizSMS
-        sms_service = EskizSMS()
-        result = sms_service.send_verification_code(formatted_phone)
-
-        if result["success"]:
-            return JsonResponse({"success": True, "message": "Код отправлен"})
-        else:
-            return JsonResponse({"success": False, "error": result.get("error", "sms_error"), "message": result.get("error", "Ошибка отправки SMS")}, status=500)
+        sms_service = get_sms_service()
+        sms_service.send_verification_code_in_background(formatted_phone)
+        return JsonResponse({"success": True, "message": "Код отправлен"})
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -640,14 +703,11 @@ def reset_password_with_phone(request):
         return JsonResponse({"success": False, "message": "Заполните все поля"}, status=400)
 
     # Format phone number
-    digits = "".join(filter(str.isdigit, phone_number))
-    if digits.startswith("998"):
-        digits = digits[3:]
+    digits = _phone_digits(phone_number)
     formatted_phone = f"+998{digits}"
 
     # Verify code first
-    from .services import EskizSMS
-    sms_service = EskizSMS()
+    sms_service = get_sms_service()
     result = sms_service.verify_code(formatted_phone, code)
 
     if not result["success"]:
@@ -658,16 +718,17 @@ def reset_password_with_phone(request):
             return JsonResponse({"success": False, "error": "invalid_code", "message": "Неверный код"}, status=400)
 
     # Find participant and reset password
-    try:
-        participant = Participant.objects.get(phone_number=formatted_phone)
-    except Participant.DoesNotExist:
-        return JsonResponse({"success": False, "message": "Пользователь не найден"}, status=404)
+    with transaction.atomic():
+        try:
+            participant = Participant.objects.select_for_update().only("id", "password").get(phone_number=formatted_phone)
+        except Participant.DoesNotExist:
+            return JsonResponse({"success": False, "message": "Пользователь не найден"}, status=404)
 
-    if len(new_password) < 4:
-        return JsonResponse({"success": False, "message": "Пароль должен быть минимум 4 символа"}, status=400)
+        if len(new_password) < 4:
+            return JsonResponse({"success": False, "message": "Пароль должен быть минимум 4 символа"}, status=400)
 
-    participant.set_password(new_password)
-    participant.save()
+        participant.set_password(new_password)
+        Participant.objects.filter(pk=participant.pk).update(password=participant.password)
 
     return JsonResponse({"success": True, "message": "Пароль успешно изменён"})
 
@@ -676,7 +737,9 @@ class AchievementDetailView(View):
     """Detail page for a single Achievement (Shon-sharaf zali card)."""
 
     def get(self, request, pk):
-        achievement = get_object_or_404(Achievement, pk=pk, is_active=True)
+        achievement = Achievement.get_active_detail(pk)
+        if achievement is None:
+            raise Http404("Achievement not found")
         gallery_images = achievement.gallery_images.all()
         return render(request, "public/detail_card.html", {
             "achievement": achievement,
@@ -1,4 +1,5 @@
 import os
+import sys
 import django
 from datetime import datetime, timezone as tz
 
@@ -6,54 +7,113 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
 from apps.public.models import Participant, Order, OlympiadSettings
-from django.db.models import Q
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+_qn = connection.ops.quote_name
+
+# Recent participants, each olympiad's group rule and the resulting
+# (olympiad, participant) memberships, shared by both report queries.
+GROUPS_CTE = f"""
+    WITH recent AS (
+        SELECT id, fullname, grade, created_at
+        FROM {_qn(Participant._meta.db_table)}
+        WHERE created_at >= %s
+    ),
+    olympiad AS (
+        SELECT id, event_name, created_at,
+            CASE
+                WHEN LOWER(event_name) LIKE '%%maktabgacha%%' THEN 'registered'
+                WHEN LOWER(event_name) LIKE '%%bog''cha%%' THEN 'preschool'
+                ELSE 'school'
+            END AS logic
+        FROM {_qn(OlympiadSettings._meta.db_table)}
+    ),
+    grp AS (
+        SELECT o.id AS olympiad_id, r.id AS participant_id
+        FROM olympiad o
+        JOIN recent r ON (
+            (o.logic = 'registered' AND EXISTS (
+                SELECT 1 FROM {_qn(Order._meta.db_table)} x
+                WHERE x.olympiad_id = o.id AND x.participant_id = r.id
+            ))
+            OR (o.logic = 'preschool' AND r.grade = 0)
+            OR (o.logic = 'school' AND r.grade BETWEEN 1 AND 11)
+        )
+    ),
+    paid AS (
+        SELECT DISTINCT olympiad_id, participant_id
+        FROM {_qn(Order._meta.db_table)}
+        WHERE status = 'paid'
+    ),
+    overlap AS (
+        SELECT participant_id, COUNT(*) AS n
+        FROM grp
+        GROUP BY participant_id
+        HAVING COUNT(*) > 1
+    )
+"""
+
+# One row per olympiad: group size, paid participants and the overlap total
+OLYMPIAD_STATS_SQL = """
+    SELECT o.event_name, o.logic, COUNT(g.participant_id), COUNT(p.participant_id),
+        (SELECT COUNT(*) FROM overlap)
+    FROM olympiad o
+    LEFT JOIN grp g ON g.olympiad_id = o.id
+    LEFT JOIN paid p ON p.olympiad_id = g.olympiad_id AND p.participant_id = g.participant_id
+    GROUP BY o.id, o.event_name, o.logic, o.created_at
+    ORDER BY o.created_at DESC
+"""
+
+OVERLAP_DETAILS_SQL = """
+    SELECT r.id, r.fullname, r.grade, v.n
+    FROM overlap v
+    JOIN recent r ON r.id = v.participant_id
+    ORDER BY r.created_at DESC
+    LIMIT 5
+"""
 
 def run():
-    cutoff_date = datetime(2026, 2, 12, 0, 0, 0, tzinfo=tz.utc)
-    recent = Participant.objects.filter(created_at__gte=cutoff_date)
-    print(f'Total recent participants: {recent.count()}')
-
-    p_with_orders = Participant.objects.filter(orders__isnull=False, created_at__gte=cutoff_date).distinct().count()
-    p_without_orders = Participant.objects.filter(orders__isnull=True, created_at__gte=cutoff_date).count()
-    print(f'Recent participants with orders: {p_with_orders}')
-    print(f'Recent participants without orders: {p_without_orders}')
-
-    olympiads = OlympiadSettings.objects.all()
-    all_groups_pks = []
-    
-    for o in olympiads:
-        print(f'\nOlympiad: {o.event_name}')
-        is_preschool = "bog'cha" in o.event_name.lower() or "maktabgacha" in o.event_name.lower()
-        all_orders = Order.objects.filter(olympiad=o)
-        registered_ids = set(all_orders.values_list('participant_id', flat=True).distinct())
-        
-        if is_preschool and "maktabgacha" in o.event_name.lower():
-            all_participants = recent.filter(id__in=registered_ids)
-            print('Logic: Registered with orders')
-        else:
-            if is_preschool:
-                age_group_filter = Q(grade=0)
+    # One consistent read-only snapshot for every query in the report
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+
+        cutoff_date = datetime(2026, 2, 12, 0, 0, 0, tzinfo=tz.utc)
+        recent = Participant.objects.filter(created_at__gte=cutoff_date)
+        print(f'Total recent participants: {recent.count()}')
+
+        has_orders = Exists(Order.objects.filter(participant_id=OuterRef('pk')))
+        p_with_orders = recent.filter(has_orders).count()
+        p_without_orders = recent.filter(~has_orders).count()
+        print(f'Recent participants with orders: {p_with_orders}')
+        print(f'Recent participants without orders: {p_without_orders}')
+
+        params = [connection.ops.adapt_datetimefield_value(cutoff_date)]
+        with connection.cursor() as cursor:
+            cursor.execute(GROUPS_CTE + OLYMPIAD_STATS_SQL, params)
+            olympiad_rows = cursor.fetchall()
+            cursor.execute(GROUPS_CTE + OVERLAP_DETAILS_SQL, params)
+            overlap_rows = cursor.fetchall()
+
+        for event_name, logic, total, paid, _ in olympiad_rows:
+            lines = [f'\nOlympiad: {event_name}']
+            if logic == 'registered':
+                lines.append('Logic: Registered with orders')
             else:
-                age_group_filter = Q(grade__in=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11])
-            all_participants = recent.filter(age_group_filter)
-            print(f'Logic: Age group filter')
-        
-        paid_ids = set(all_orders.filter(status='paid').values_list('participant_id', flat=True).distinct())
-        paid_in_group = all_participants.filter(id__in=paid_ids)
-        
-        print(f'Total in group: {all_participants.count()}')
-        print(f'Paid in group (Ishtirokchilar): {paid_in_group.count()}')
-        print(f'Unpaid (Kutmoqda): {all_participants.count() - paid_in_group.count()}')
-        
-        all_groups_pks.extend(list(all_participants.values_list('id', flat=True)))
-
-    from collections import Counter
-    counts = Counter(all_groups_pks)
-    overlaps = {pk: count for pk, count in counts.items() if count > 1}
-    print(f'\nParticipants in multiple groups: {len(overlaps)}')
-    for pk, count in list(overlaps.items())[:5]:
-        p = Participant.objects.get(pk=pk)
-        print(f' - Participant {p.fullname} (ID: {p.id}, Grade: {p.grade}) is in {count} groups')
+                lines.append('Logic: Age group filter')
+            lines.append(f'Total in group: {total}')
+            lines.append(f'Paid in group (Ishtirokchilar): {paid}')
+            lines.append(f'Unpaid (Kutmoqda): {total - paid}')
+            sys.stdout.write('\n'.join(lines) + '\n')
+
+        overlap_count = olympiad_rows[0][4] if olympiad_rows else 0
+        lines = [f'\nParticipants in multiple groups: {overlap_count}']
+        to_pk = Participant._meta.pk.to_python
+        for pk, fullname, grade, count in overlap_rows:
+            lines.append(f' - Participant {fullname} (ID: {to_pk(pk)}, Grade: {grade}) is in {count} groups')
+        sys.stdout.write('\n'.join(lines) + '\n')
 
 if __name__ == '__main__':
     run()